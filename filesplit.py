@@ -1,25 +1,53 @@
+import hashlib
+import os
+import pickle
+import tempfile
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from io import BytesIO
+from itertools import chain, islice
 from typing import Dict, List, Optional, Set, Tuple
 
 import openpyxl
 import streamlit as st
+from openpyxl.cell.cell import Cell
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.merge import MergedCellRange
 
 CANONICAL_LEAD_ALIASES = {
     "fauziahasansiddiqui": "Fauzia Hasan",
 }
 
+# Workbook bodies are already deflated, so the bundle stores them as-is by default. When
+# compression is requested, level 1 gives near-identical size at a fraction of the CPU.
+ZIP_COMPRESSION_LEVEL = 1
+
+# Sheet name -> (first data row, source rows per canonical lead), built by the discovery pass.
+SheetLeadRows = Dict[str, Tuple[int, Dict[str, List[int]]]]
+
+# Per sheet: (sheet name, header row values or None when the header is missing, non-blank data rows).
+SheetDataRows = List[Tuple[str, Optional[tuple], List[tuple]]]
+
+# Per-process state for pool workers, populated by _init_lead_worker. Only worker processes use it.
+_lead_worker_state: Dict[str, object] = {}
+
+
+# Deletes every character str.split() treats as whitespace (all of them sit below U+3001).
+_WHITESPACE_TABLE = dict.fromkeys(code for code in range(0x3001) if chr(code).isspace())
+
 
 def _normalize_header(value) -> str:
-    """Lowercase header name stripped of surrounding whitespace."""
-    return "".join(str(value).split()).lower()
+    """Casefolded header name with all whitespace removed."""
+    return str(value).translate(_WHITESPACE_TABLE).casefold()
 
 
-def _canonicalize_lead(name) -> str:
-    """Return canonical team lead name so aliases collapse into one."""
-    if name is None:
-        return ""
-    stripped = str(name).strip()
+@lru_cache(maxsize=100_000)
+def _canonicalize_text(text: str) -> str:
+    """Cached body of _canonicalize_lead; lead names repeat across thousands of rows."""
+    stripped = text.strip()
     if not stripped:
         return ""
 
@@ -27,6 +55,19 @@ def _canonicalize_lead(name) -> str:
     return CANONICAL_LEAD_ALIASES.get(normalized, stripped)
 
 
+def _canonicalize_lead(name) -> str:
+    """Return canonical team lead name so aliases collapse into one."""
+    if name is None:
+        return ""
+    # Key the cache on the text so values like 1 and True do not share an entry.
+    return _canonicalize_text(str(name))
+
+
+def workbook_digest(data: bytes) -> bytes:
+    """Return a short BLAKE2b digest of workbook bytes, which cached builders key on instead of hashing the bytes."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
 def sanitize_prefix(prefix: str) -> str:
     """Ensure prefix ends with a single space when provided."""
     if not prefix:
@@ -34,124 +75,339 @@ def sanitize_prefix(prefix: str) -> str:
     return prefix if prefix.endswith(" ") else f"{prefix} "
 
 
-def get_column_letter_by_header(sheet, header_names) -> Tuple[Optional[str], Optional[int]]:
-    """Return the column letter and header row index for the first matching header."""
+def _find_header_position(rows, header_names) -> Tuple[Optional[int], Optional[int]]:
+    """Return the 1-based column index and row index of the first matching header in raw row values."""
     if isinstance(header_names, str):
         header_names = [header_names]
 
-    normalized_targets = {_normalize_header(name) for name in header_names if name}
+    # Accept exact matches and simple plural forms (Team Lead vs Team Leads). An exact match
+    # implies equal singular forms, so comparing singulars alone covers both cases.
+    singular_targets = frozenset(_normalize_header(name).rstrip("s") for name in header_names if name)
 
-    # Search the first few rows for headers because some sheets have blank top rows.
-    max_scan_row = min(sheet.max_row, 10) or 1
-    for row in sheet.iter_rows(min_row=1, max_row=max_scan_row):
-        for cell in row:
-            if cell.value is None:
+    for row_idx, row_values in enumerate(rows, start=1):
+        for col_idx, value in enumerate(row_values, start=1):
+            if value is None:
                 continue
 
-            normalized_value = _normalize_header(cell.value)
-            if not normalized_value:
+            normalized_value = _normalize_header(value)
+            if normalized_value and normalized_value.rstrip("s") in singular_targets:
+                return col_idx, row_idx
+
+    return None, None
+
+
+def get_column_letter_by_header(sheet, header_names) -> Tuple[Optional[str], Optional[int]]:
+    """Return the column letter and header row index for the first matching header."""
+    # Search the first few rows for headers because some sheets have blank top rows.
+    # Read-only sheets with unknown dimensions report no max_row, so just scan ten rows there.
+    max_scan_row = min(sheet.max_row or 10, 10)
+    col_idx, header_row = _find_header_position(
+        sheet.iter_rows(min_row=1, max_row=max_scan_row, values_only=True), header_names
+    )
+    if col_idx is None:
+        return None, None
+    return get_column_letter(col_idx), header_row
+
+
+def read_sheet_data_rows(file_bytes: bytes, header_names) -> SheetDataRows:
+    """
+    Return every sheet's header row values and non-blank data rows below it.
+
+    Kept at module level so the Consolidate page can hand it to worker processes; functions
+    defined on a page cannot be pickled by reference.
+    """
+    # Formulas are read as written rather than as cached results: workbooks saved by openpyxl,
+    # including this app's split outputs, store no results, so data_only would read them as empty.
+    workbook = openpyxl.load_workbook(BytesIO(file_bytes), read_only=True, keep_links=False)
+    sheets: SheetDataRows = []
+    # openpyxl writes cell text inline rather than to a shared-string table, so workbooks this
+    # app produced repeat every lead name as a separate string. Share one object per value.
+    string_pool: Dict[str, str] = {}
+    intern = string_pool.setdefault
+    try:
+        for sheet_name in workbook.sheetnames:
+            ws = workbook[sheet_name]
+            # Some writers store a stale dimension; ignore it so every row is streamed.
+            ws.reset_dimensions()
+            # Read the sheet in a single stream: the header search consumes the first rows and
+            # the data rows continue from there, instead of reopening the sheet at the header.
+            rows = ws.iter_rows(values_only=True)
+            top_rows = list(islice(rows, 10))
+            col_idx, header_row = _find_header_position(top_rows, header_names)
+            if col_idx is None:
+                sheets.append((sheet_name, None, []))
                 continue
 
-            for normalized_target in normalized_targets:
-                # Accept exact matches and simple plural forms (Team Lead vs Team Leads).
-                if (
-                    normalized_value == normalized_target
-                    or normalized_value.rstrip("s") == normalized_target.rstrip("s")
-                ):
-                    return cell.column_letter, cell.row
+            header_values = top_rows[header_row - 1]
+            data_rows = [
+                tuple(intern(value, value) if isinstance(value, str) else value for value in row)
+                for row in chain(top_rows[header_row:], rows)
+                if not all(value in (None, "") for value in row)
+            ]
+            sheets.append((sheet_name, header_values, data_rows))
+    finally:
+        workbook.close()
+    return sheets
+
+
+def _split_sheet_layout(ws, first_row: int) -> Dict[str, object]:
+    """
+    Split a worksheet into the block above first_row and data grouped by source row.
+
+    Cells and row dimensions are split by row; merged ranges are kept as bounds so they can
+    be renumbered along with the rows they cover.
+    """
+    header_cells: Dict[Tuple[int, int], Cell] = {}
+    data_rows: Dict[int, List[Cell]] = {}
+    for (row, col), cell in ws._cells.items():
+        if row < first_row:
+            header_cells[row, col] = cell
+        else:
+            data_rows.setdefault(row, []).append(cell)
+
+    header_dims = {row: dim for row, dim in ws.row_dimensions.items() if row < first_row}
+    data_dims = {row: dim for row, dim in ws.row_dimensions.items() if row >= first_row}
+
+    return {
+        "header_cells": header_cells,
+        "data_rows": data_rows,
+        "header_dims": header_dims,
+        "data_dims": data_dims,
+        "merged_bounds": [merged.bounds for merged in ws.merged_cells.ranges],
+    }
+
+
+def _fill_sheet_rows(ws, layout: Dict[str, object], source_rows: List[int], first_row: int) -> None:
+    """Replace the data area of ws with source_rows, renumbered contiguously from first_row."""
+    new_row_by_source = {source_row: new_row for new_row, source_row in enumerate(source_rows, start=first_row)}
+
+    cells = dict(layout["header_cells"])
+    data_rows = layout["data_rows"]
+    for source_row, new_row in new_row_by_source.items():
+        for cell in data_rows.get(source_row, ()):
+            cell.row = new_row
+            if cell.hyperlink:
+                cell.hyperlink.ref = cell.coordinate
+            cells[new_row, cell.column] = cell
+    ws._cells = cells
+    ws._current_row = max((row for row, _ in cells), default=0)
+
+    row_dimensions = ws.row_dimensions
+    row_dimensions.clear()
+    row_dimensions.update(layout["header_dims"])
+    data_dims = layout["data_dims"]
+    for source_row, new_row in new_row_by_source.items():
+        dim = data_dims.get(source_row)
+        if dim is not None:
+            dim.index = new_row
+            row_dimensions[new_row] = dim
+
+    # Keep a merged range only when every row it covers survives, still adjacent.
+    merged_ranges = []
+    for min_col, min_row, max_col, max_row in layout["merged_bounds"]:
+        new_rows = [
+            row if row < first_row else new_row_by_source.get(row) for row in range(min_row, max_row + 1)
+        ]
+        if None in new_rows or new_rows != list(range(new_rows[0], new_rows[0] + len(new_rows))):
+            continue
+        merged_ranges.append(
+            MergedCellRange(ws, CellRange(min_col=min_col, min_row=new_rows[0], max_col=max_col, max_row=new_rows[-1]).coord)
+        )
+    ws.merged_cells = MultiCellRange(merged_ranges)
+
+
+def _load_lead_template(master_source, sheet_lead_rows: SheetLeadRows) -> Dict[str, object]:
+    """Parse the master (a path or file object) and split each sheet so lead workbooks can be rendered."""
+    workbook = openpyxl.load_workbook(master_source)
+    return {
+        "workbook": workbook,
+        "sheet_lead_rows": sheet_lead_rows,
+        "legacy_drawings": {ws.title: ws.legacy_drawing for ws in workbook.worksheets},
+        "image_data": [(image, image.ref.getvalue()) for ws in workbook.worksheets for image in ws._images],
+        "sheet_layouts": {
+            sheet_name: _split_sheet_layout(workbook[sheet_name], first_row)
+            for sheet_name, (first_row, _) in sheet_lead_rows.items()
+        },
+    }
+
+
+def _render_lead_workbook(template: Dict[str, object], lead: str) -> bytes:
+    """Return the workbook bytes holding only lead's rows, built from a _load_lead_template result."""
+    workbook = template["workbook"]
+    sheet_layouts = template["sheet_layouts"]
+
+    # Each lead's output swaps only its own rows into the data area instead of reloading the
+    # workbook and shifting rows with delete_rows.
+    for sheet_name, (first_row, rows_by_lead) in template["sheet_lead_rows"].items():
+        source_rows = rows_by_lead.get(lead, [])
+        _fill_sheet_rows(workbook[sheet_name], sheet_layouts[sheet_name], source_rows, first_row)
+
+    # openpyxl assumes a workbook is saved once: saving points each sheet with comments at a
+    # generated VML part and closes every image's data stream, so undo both before each save.
+    for ws in workbook.worksheets:
+        ws.legacy_drawing = template["legacy_drawings"][ws.title]
+    for image, data in template["image_data"]:
+        image.ref = BytesIO(data)
+
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
 
-    return None, None
+
+def _init_lead_worker(master_path: str, sheet_lead_rows: SheetLeadRows) -> None:
+    """Parse the master once per worker process so every lead handled there reuses it."""
+    _lead_worker_state.update(_load_lead_template(master_path, sheet_lead_rows))
+
+
+def _build_one_lead_workbook(lead: str) -> Tuple[str, bytes]:
+    """Return lead with its workbook bytes, built from the state loaded by _init_lead_worker."""
+    return lead, _render_lead_workbook(_lead_worker_state, lead)
+
+
+def _worker_count(task_count: int) -> int:
+    """Number of worker processes worth starting for task_count independent tasks."""
+    return min(task_count, os.cpu_count() or 1)
+
+
+def map_in_workers(fn, items: List, **pool_kwargs) -> Optional[List]:
+    """
+    Return [fn(item) for item in items] computed on a process pool, or None to run in-process.
+
+    None is returned when a single worker would do, or when worker processes cannot be started
+    or sent the task (fork refused, unpicklable callables). fn must be a module-level function
+    of an importable module; pool_kwargs are passed to ProcessPoolExecutor.
+    """
+    max_workers = _worker_count(len(items))
+    if max_workers <= 1:
+        return None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, **pool_kwargs) as pool:
+            return list(pool.map(fn, items))
+    except (BrokenProcessPool, pickle.PicklingError, OSError):
+        return None
+
+
+def _build_lead_workbooks(
+    master_file_bytes: bytes, sheet_lead_rows: SheetLeadRows, leads: List[str]
+) -> Dict[str, bytes]:
+    """Build every lead's workbook, spreading the leads across worker processes when possible."""
+    if _worker_count(len(leads)) > 1:
+        results = None
+        master_path = None
+        try:
+            # Workers read the master from a temporary file rather than receiving a pickled copy
+            # of the bytes each; reads go through the OS page cache, which all workers share.
+            with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as master_file:
+                master_path = master_file.name
+                master_file.write(master_file_bytes)
+            results = map_in_workers(
+                _build_one_lead_workbook,
+                leads,
+                initializer=_init_lead_worker,
+                initargs=(master_path, sheet_lead_rows),
+            )
+        except OSError:
+            # The temporary file could not be written; build in-process below.
+            pass
+        finally:
+            if master_path is not None:
+                os.unlink(master_path)
+        if results is not None:
+            return dict(results)
+
+    # Keep the template local: Streamlit sessions share this process and run concurrently.
+    template = _load_lead_template(BytesIO(master_file_bytes), sheet_lead_rows)
+    return {lead: _render_lead_workbook(template, lead) for lead in leads}
 
 
 @st.cache_data(show_spinner=False)
 def generate_entity_workbooks(
-    master_file_bytes: bytes, header_label: str
-) -> Tuple[List[str], Dict[str, bytes], List[str]]:
-    """Return the sorted entity names, workbook bytes per entity, and sheets lacking the column."""
-    original_wb = openpyxl.load_workbook(BytesIO(master_file_bytes))
-    sheet_names = original_wb.sheetnames
+    _master_file_bytes: bytes, master_digest: bytes, header_label: str
+) -> Tuple[List[str], SheetLeadRows, List[str]]:
+    """Return the sorted entity names, the source rows per entity, and sheets lacking the column."""
+    # Drop names cached for a previous upload so the cache only holds this workbook's leads.
+    _canonicalize_text.cache_clear()
+
+    # Discovery only needs cell values from one column, so stream it in read-only mode.
+    scan_wb = openpyxl.load_workbook(
+        BytesIO(_master_file_bytes), read_only=True, data_only=True, keep_links=False
+    )
+    sheet_names = scan_wb.sheetnames
 
     entity_names: Set[str] = set()
     missing_sheets: List[str] = []
+    # Source rows grouped by lead once here, so building each lead's output never scans rows.
+    sheet_lead_rows: SheetLeadRows = {}
 
     header_variants = [header_label, f"{header_label}s"]
 
-    for sheet_name in sheet_names:
-        ws = original_wb[sheet_name]
-        col_letter, header_row = get_column_letter_by_header(ws, header_variants)
-        if not col_letter:
-            missing_sheets.append(sheet_name)
-            continue
-
-        for row in range(header_row + 1, ws.max_row + 1):  # Skip header row
-            val = ws[f"{col_letter}{row}"].value
-            if val is None:
+    try:
+        for sheet_name in sheet_names:
+            ws = scan_wb[sheet_name]
+            ws.reset_dimensions()
+            col_idx, header_row = _find_header_position(
+                ws.iter_rows(min_row=1, max_row=10, values_only=True), header_variants
+            )
+            if not col_idx:
+                missing_sheets.append(sheet_name)
                 continue
 
-            lead_name = _canonicalize_lead(val)
-            if lead_name:
-                entity_names.add(lead_name)
+            rows_by_lead: Dict[str, List[int]] = {}
+            # A lead's rows usually sit together, so keep the current lead's list while the
+            # cell value repeats instead of canonicalizing and looking it up on every row.
+            previous_val: object = None
+            lead_rows: Optional[List[int]] = None
+            for row, (val,) in enumerate(
+                ws.iter_rows(min_row=header_row + 1, min_col=col_idx, max_col=col_idx, values_only=True),
+                start=header_row + 1,
+            ):
+                if val != previous_val or type(val) is not type(previous_val):
+                    previous_val = val
+                    lead_name = _canonicalize_lead(val)
+                    lead_rows = rows_by_lead.setdefault(lead_name, []) if lead_name else None
+                if lead_rows is not None:
+                    lead_rows.append(row)
+
+            entity_names.update(rows_by_lead)
+            sheet_lead_rows[sheet_name] = (header_row + 1, rows_by_lead)
+    finally:
+        scan_wb.close()
 
     sorted_entities = sorted(entity_names)
-    original_wb.close()
 
     if not sorted_entities:
         return [], {}, missing_sheets
 
-    workbooks: Dict[str, bytes] = {}
-    for lead in sorted_entities:
-        wb_copy = openpyxl.load_workbook(BytesIO(master_file_bytes))
+    return sorted_entities, sheet_lead_rows, missing_sheets
 
-        for sheet_name in sheet_names:
-            ws_copy = wb_copy[sheet_name]
-            col_letter, header_row = get_column_letter_by_header(ws_copy, header_variants)
-            if not col_letter:
-                continue  # Skip sheet if no target column
-
-            # Loop bottom-up to delete rows not matching this lead
-            rows_to_delete = []
-            start = None
-            length = 0
-
-            for row in range(header_row + 1, ws_copy.max_row + 1):
-                cell_value = ws_copy[f"{col_letter}{row}"].value
-                cell_lead = _canonicalize_lead(cell_value)
-                if cell_lead == lead:
-                    if start is not None:
-                        rows_to_delete.append((start, length))
-                        start = None
-                        length = 0
-                    continue
-
-                if start is None:
-                    start = row
-                    length = 1
-                else:
-                    if row == start + length:
-                        length += 1
-                    else:
-                        rows_to_delete.append((start, length))
-                        start = row
-                        length = 1
-
-            if start is not None and length:
-                rows_to_delete.append((start, length))
-
-            for row_start, block_length in reversed(rows_to_delete):
-                ws_copy.delete_rows(row_start, block_length)
-
-        buffer = BytesIO()
-        wb_copy.save(buffer)
-        wb_copy.close()
-        workbooks[lead] = buffer.getvalue()
-
-    return sorted_entities, workbooks, missing_sheets
-
-
-def _create_zip_from_workbooks(workbooks: Dict[str, bytes], prefix: str) -> bytes:
-    """Package generated workbooks into a zip archive."""
+
+@st.cache_data(show_spinner=False)
+def build_lead_workbook(
+    _master_file_bytes: bytes, master_digest: bytes, header_label: str, lead: str
+) -> bytes:
+    """Return the workbook bytes for a single lead."""
+    _, sheet_lead_rows, _ = generate_entity_workbooks(_master_file_bytes, master_digest, header_label)
+    return _render_lead_workbook(_load_lead_template(BytesIO(_master_file_bytes), sheet_lead_rows), lead)
+
+
+@st.cache_data(show_spinner=False)
+def build_all_lead_workbooks(
+    _master_file_bytes: bytes, master_digest: bytes, header_label: str
+) -> Dict[str, bytes]:
+    """Return the workbook bytes for every lead, keyed by lead name in sorted order."""
+    leads, sheet_lead_rows, _ = generate_entity_workbooks(_master_file_bytes, master_digest, header_label)
+    if not leads:
+        return {}
+    return _build_lead_workbooks(_master_file_bytes, sheet_lead_rows, leads)
+
+
+def _create_zip_from_workbooks(workbooks: Dict[str, bytes], prefix: str, compress: bool = False) -> bytes:
+    """Package generated workbooks into a zip archive, deflating entries only when compress is set."""
     buffer = BytesIO()
-    with zipfile.ZipFile(buffer, "w") as zip_file:
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(
+        buffer, "w", compression=compression, compresslevel=ZIP_COMPRESSION_LEVEL
+    ) as zip_file:
         for lead, workbook_bytes in workbooks.items():
             filename = f"{prefix}{lead}.xlsx" if prefix else f"{lead}.xlsx"
             zip_file.writestr(filename, workbook_bytes)
@@ -159,6 +415,23 @@ def _create_zip_from_workbooks(workbooks: Dict[str, bytes], prefix: str) -> byte
     return buffer.getvalue()
 
 
+@st.cache_data(show_spinner=False)
+def build_lead_zip(_master_file_bytes: bytes, master_digest: bytes, header_label: str, prefix: str) -> bytes:
+    """Return the ZIP bundle of every lead's workbook, so reruns reuse the archive."""
+    workbooks = build_all_lead_workbooks(_master_file_bytes, master_digest, header_label)
+    return _create_zip_from_workbooks(workbooks, prefix)
+
+
+def _prepare_lead_download(lead: str) -> None:
+    """Mark a lead's workbook to be built on the next run."""
+    st.session_state["split_results"]["prepared_leads"].add(lead)
+
+
+def _prepare_zip_download() -> None:
+    """Mark every lead's workbook and the ZIP bundle to be built on the next run."""
+    st.session_state["split_results"]["zip_prepared"] = True
+
+
 def main() -> None:
     st.set_page_config(page_title="Split", page_icon="📄", layout="centered")
     st.title("Split")
@@ -169,7 +442,7 @@ def main() -> None:
         "1. Pick the role to split by and, if desired, set a filename prefix.\n"
         "2. Upload the consolidated workbook (header labels in row 1).\n"
         "3. Press **Generate files** to process the workbook.\n"
-        "4. Review the detected names and download the outputs."
+        "4. Review the detected names, prepare the files you need, and download them."
     )
 
     default_filter = st.session_state.get("filter_by_mentor", False)
@@ -188,11 +461,13 @@ def main() -> None:
     uploaded_file = st.file_uploader("Upload the consolidated workbook (.xlsx)", type=["xlsx"])
 
     master_bytes = uploaded_file.getvalue() if uploaded_file is not None else None
+    master_digest = None
     result_key = None
     if master_bytes is not None:
+        master_digest = workbook_digest(master_bytes)
         result_key = (
             uploaded_file.name,
-            len(master_bytes),
+            master_digest,
             target_header,
             sanitized_prefix,
         )
@@ -213,7 +488,7 @@ def main() -> None:
             return
 
         with st.spinner("Processing workbook..."):
-            leads, workbooks, missing_sheets = generate_entity_workbooks(master_bytes, target_header)
+            leads, _, missing_sheets = generate_entity_workbooks(master_bytes, master_digest, target_header)
 
         if not leads:
             st.error(f"No {target_header.lower()}s were found in the uploaded workbook.")
@@ -222,18 +497,19 @@ def main() -> None:
 
         stored_results = {
             "leads": leads,
-            "workbooks": workbooks,
             "missing_sheets": missing_sheets,
             "target_header": target_header,
             "prefix": sanitized_prefix,
             "key": result_key,
+            # Workbooks are built only once requested so session state never holds every lead's bytes.
+            "prepared_leads": set(),
+            "zip_prepared": False,
         }
         st.session_state["split_results"] = stored_results
         sanitized_prefix = stored_results["prefix"]
     elif should_show_results:
         stored_results = st.session_state["split_results"]
         leads = stored_results["leads"]
-        workbooks = stored_results["workbooks"]
         missing_sheets = stored_results["missing_sheets"]
         target_header = stored_results["target_header"]
         sanitized_prefix = stored_results["prefix"]
@@ -258,27 +534,54 @@ def main() -> None:
         return
 
     st.success(f"Found {len(leads)} {target_header.lower()}s.")
-    st.write("Download the generated files below.")
-
-    zip_bytes = _create_zip_from_workbooks(workbooks, sanitized_prefix)
-    st.download_button(
-        label="Download all workbooks as ZIP",
-        data=zip_bytes,
-        file_name=f"{target_header.lower().replace(' ', '-')}-workbooks.zip",
-        mime="application/zip",
-        use_container_width=True,
-    )
+    st.write("Prepare the files you need, then download them below.")
+
+    all_workbooks: Optional[Dict[str, bytes]] = None
+    if stored_results["zip_prepared"]:
+        with st.spinner("Building workbooks..."):
+            all_workbooks = build_all_lead_workbooks(master_bytes, master_digest, target_header)
+        st.download_button(
+            label="Download all workbooks as ZIP",
+            data=build_lead_zip(master_bytes, master_digest, target_header, sanitized_prefix),
+            file_name=f"{target_header.lower().replace(' ', '-')}-workbooks.zip",
+            mime="application/zip",
+            on_click="ignore",
+            use_container_width=True,
+        )
+    else:
+        st.button(
+            "Prepare all workbooks as ZIP",
+            on_click=_prepare_zip_download,
+            use_container_width=True,
+        )
 
     st.subheader("Individual downloads")
     columns = st.columns(2)
+    prepared_leads = stored_results["prepared_leads"]
     for index, lead in enumerate(leads):
         column = columns[index % len(columns)]
+        if all_workbooks is None and lead not in prepared_leads:
+            column.button(
+                f"Prepare {lead}",
+                key=f"prepare_{lead}",
+                on_click=_prepare_lead_download,
+                args=(lead,),
+                use_container_width=True,
+            )
+            continue
+
+        if all_workbooks is not None:
+            workbook_bytes = all_workbooks[lead]
+        else:
+            with st.spinner(f"Building {lead}..."):
+                workbook_bytes = build_lead_workbook(master_bytes, master_digest, target_header, lead)
         column.download_button(
             label=f"Download {lead}",
-            data=workbooks[lead],
+            data=workbook_bytes,
             file_name=f"{sanitized_prefix}{lead}.xlsx" if sanitized_prefix else f"{lead}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             key=f"download_{lead}",
+            on_click="ignore",
             use_container_width=True,
         )
 
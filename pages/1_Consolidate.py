@@ -1,12 +1,32 @@
+import datetime
+import zipfile
 from copy import copy
+from functools import partial
 from io import BytesIO
 from typing import Dict, List, Optional, Sequence, Tuple
 
 import openpyxl
 import streamlit as st
+from openpyxl.cell.cell import Cell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.writer.excel import ExcelWriter
 
-from filesplit import get_column_letter_by_header
+from filesplit import (
+    SheetDataRows,
+    get_column_letter_by_header,
+    map_in_workers,
+    read_sheet_data_rows,
+    workbook_digest,
+)
+
+# Parsed cells _parsed_sheet_store keeps across all sessions before dropping the oldest workbooks.
+PARSED_CELL_LIMIT = 2_000_000
+
+# The merged workbook is downloaded once and opened straight away; deflate level 1 saves
+# noticeably faster than zlib's default for a modestly larger file.
+OUTPUT_COMPRESSION_LEVEL = 1
 
 
 def _load_uploaded_files(uploaded_files) -> Sequence[Tuple[str, bytes]]:
@@ -17,55 +37,238 @@ def _load_uploaded_files(uploaded_files) -> Sequence[Tuple[str, bytes]]:
     return tuple(buffers)
 
 
+def _workbook_bytes(workbook: openpyxl.Workbook) -> bytes:
+    """Serialize workbook like Workbook.save, deflating at OUTPUT_COMPRESSION_LEVEL."""
+    buffer = BytesIO()
+    archive = zipfile.ZipFile(
+        buffer, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=OUTPUT_COMPRESSION_LEVEL
+    )
+    workbook.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    ExcelWriter(workbook, archive).save()
+    return buffer.getvalue()
+
+
 def _last_data_row(ws: Worksheet, header_row: int) -> int:
     """Find the last row containing data below the header."""
+    # ws[row] recomputes max_column from every stored cell, so read the bounds once.
+    max_col = ws.max_column
+    cell = ws.cell
     for row_idx in range(ws.max_row, header_row, -1):
-        for cell in ws[row_idx]:
-            if cell.value not in (None, ""):
+        for col_idx in range(1, max_col + 1):
+            if cell(row=row_idx, column=col_idx).value not in (None, ""):
                 return row_idx
     return header_row
 
 
-def _append_row_with_style(destination_ws: Worksheet, source_row) -> None:
-    """Append a row to destination_ws copying both values and styles."""
-    values = [cell.value for cell in source_row]
-    destination_ws.append(values)
-    dest_row_idx = destination_ws.max_row
-    for dest_cell, src_cell in zip(destination_ws[dest_row_idx], source_row):
+def _find_header_cached(
+    ws, header_variants: List[str], header_cache: Dict[str, Tuple[tuple, Tuple[str, int]]]
+) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Locate the header like get_column_letter_by_header, reusing an earlier file's result.
+
+    header_cache maps a sheet name to the rows up to its header and the header position. When
+    a later sheet of the same name starts with identical rows the scan would stop at the same
+    cell, so the cached position is returned. Scope the cache to a single merge.
+    """
+    cached = header_cache.get(ws.title)
+    if cached is not None:
+        top_rows, position = cached
+        if tuple(ws.iter_rows(min_row=1, max_row=len(top_rows), values_only=True)) == top_rows:
+            return position
+
+    col_letter, header_row = get_column_letter_by_header(ws, header_variants)
+    if col_letter:
+        top_rows = tuple(ws.iter_rows(min_row=1, max_row=header_row, values_only=True))
+        header_cache[ws.title] = (top_rows, (col_letter, header_row))
+    return col_letter, header_row
+
+
+def _append_row_with_style(
+    destination_ws: Worksheet, source_row, style_cache: Dict[Tuple[int, ...], StyleArray]
+) -> None:
+    """
+    Append a row to destination_ws copying both values and styles.
+
+    The destination cells are built alongside the source row and appended in one call, so the
+    new row is never looked up again cell by cell. style_cache maps a source style to its
+    destination equivalent and must be scoped to one source workbook, because style indices
+    are only meaningful within their own workbook.
+    """
+    dest_cells = []
+    for src_cell in source_row:
+        dest_cell = Cell(destination_ws, value=src_cell.value)
         if src_cell.has_style:
-            dest_cell.font = copy(src_cell.font)
-            dest_cell.border = copy(src_cell.border)
-            dest_cell.fill = copy(src_cell.fill)
-            dest_cell.number_format = copy(src_cell.number_format)
-            dest_cell.protection = copy(src_cell.protection)
-            dest_cell.alignment = copy(src_cell.alignment)
-        dest_cell.hyperlink = src_cell.hyperlink
-        dest_cell.comment = copy(src_cell.comment) if src_cell.comment else None
+            style_key = tuple(src_cell._style)
+            cached_style = style_cache.get(style_key)
+            if cached_style is not None:
+                dest_cell._style = copy(cached_style)
+            else:
+                dest_cell.font = copy(src_cell.font)
+                dest_cell.border = copy(src_cell.border)
+                dest_cell.fill = copy(src_cell.fill)
+                dest_cell.number_format = copy(src_cell.number_format)
+                dest_cell.protection = copy(src_cell.protection)
+                dest_cell.alignment = copy(src_cell.alignment)
+                style_cache[style_key] = copy(dest_cell._style)
+        dest_cells.append(dest_cell)
+    destination_ws.append(dest_cells)
+
+    # Hyperlinks take their reference from the cell coordinate, which is only known once appended.
+    for dest_cell, src_cell in zip(dest_cells, source_row):
+        if src_cell.hyperlink:
+            dest_cell.hyperlink = src_cell.hyperlink
+        if src_cell.comment:
+            dest_cell.comment = copy(src_cell.comment)
+
+
+@st.cache_resource(show_spinner=False)
+def _parsed_sheet_store() -> Dict[Tuple[bytes, Tuple[str, ...]], Tuple[int, SheetDataRows]]:
+    """
+    Parsed sheets and their cell count, keyed by workbook digest and header names.
 
+    Shared across reruns and sessions, so re-merging after adding a file or flipping back to a
+    header parses only the workbooks not seen with that header yet. Sessions run as threads of
+    one process and may evict entries at any time, so read entries with get() only once.
+    """
+    return {}
 
-@st.cache_data(show_spinner=False)
-def build_consolidated_workbook(
-    uploaded_files: Sequence[Tuple[str, bytes]], header_label: str
-) -> Tuple[Optional[bytes], Dict[str, List[str]], int]:
+
+def _trim_parsed_sheet_store(store: Dict[Tuple[bytes, Tuple[str, ...]], Tuple[int, SheetDataRows]]) -> None:
+    """Drop the oldest workbooks until the store holds at most PARSED_CELL_LIMIT cells."""
+    kept_cells = 0
+    for key in reversed(list(store)):
+        entry = store.get(key)
+        if entry is None:
+            continue
+        kept_cells += entry[0]
+        if kept_cells > PARSED_CELL_LIMIT:
+            store.pop(key, None)
+
+
+def _read_additional_files(
+    uploaded_files: Sequence[Tuple[str, bytes]],
+    file_digests: Sequence[Tuple[str, bytes]],
+    header_variants: List[str],
+) -> List[SheetDataRows]:
+    """Read each file's sheets, parsing unseen files across worker processes when possible."""
+    store = _parsed_sheet_store()
+    header_key = tuple(header_variants)
+    keys = [(digest, header_key) for _, digest in file_digests]
+
+    # Take what is cached now; another session may evict it while the rest are parsed.
+    found: Dict[Tuple[bytes, Tuple[str, ...]], SheetDataRows] = {}
+    for key in keys:
+        entry = store.get(key)
+        if entry is not None:
+            found[key] = entry[1]
+    # Keyed by digest, so a workbook uploaded twice is still parsed once.
+    unparsed = {key: file_bytes for key, (_, file_bytes) in zip(keys, uploaded_files) if key not in found}
+
+    read_file = partial(read_sheet_data_rows, header_names=header_variants)
+    parsed = map_in_workers(read_file, list(unparsed.values()))
+    if parsed is None:
+        parsed = [read_file(file_bytes) for file_bytes in unparsed.values()]
+
+    for key, sheets in zip(unparsed, parsed):
+        found[key] = sheets
+        cell_count = sum(len(row) for _, _, data_rows in sheets for row in data_rows)
+        store[key] = (cell_count, sheets)
+    _trim_parsed_sheet_store(store)
+    return [found[key] for key in keys]
+
+
+def _build_values_only_workbook(
+    uploaded_files: Sequence[Tuple[str, bytes]],
+    file_digests: Sequence[Tuple[str, bytes]],
+    header_variants: List[str],
+) -> Tuple[bytes, Dict[str, List[str]], int]:
     """
-    Merge the provided workbooks into a single workbook.
+    Merge cell values and formulas, streaming every input in read-only mode into a write-only workbook.
 
-    Returns the combined workbook bytes, any sheets missing the target header,
-    and the total merged row count.
+    Mirrors the styled merge: the first workbook's sheets are copied whole and later
+    workbooks append their non-empty data rows. The later workbooks are parsed in worker
+    processes when more than one core is available, and each parse is reused across runs.
     """
-    if not uploaded_files:
+    missing_by_file: Dict[str, List[str]] = {}
+    output_wb = openpyxl.Workbook(write_only=True)
+    output_sheets: Dict[str, WriteOnlyWorksheet] = {}
+    total_rows = 0
+
+    base_name, base_bytes = uploaded_files[0]
+    base_wb = openpyxl.load_workbook(BytesIO(base_bytes), read_only=True, keep_links=False)
+    try:
+        for sheet_name in base_wb.sheetnames:
+            ws_src = base_wb[sheet_name]
+            ws_src.reset_dimensions()
+            col_letter, header_row = get_column_letter_by_header(ws_src, header_variants)
+
+            # The base workbook is kept whole, including sheets without the header.
+            ws_out = output_wb.create_sheet(title=sheet_name)
+            last_row = 0
+            for row_idx, row_values in enumerate(ws_src.iter_rows(values_only=True), start=1):
+                if all(value in (None, "") for value in row_values):
+                    continue
+                # Only write blank rows that sit between data, so appended rows follow the last one.
+                for _ in range(row_idx - last_row - 1):
+                    ws_out.append(())
+                ws_out.append(row_values)
+                last_row = row_idx
+
+            if not col_letter:
+                missing_by_file.setdefault(base_name, []).append(sheet_name)
+                continue
+            output_sheets[sheet_name] = ws_out
+            total_rows += max(0, last_row - header_row)
+    finally:
+        base_wb.close()
+
+    additional_files = uploaded_files[1:]
+    for (filename, _), sheets in zip(
+        additional_files, _read_additional_files(additional_files, file_digests[1:], header_variants)
+    ):
+        for sheet_name, header_values, data_rows in sheets:
+            if header_values is None:
+                missing_by_file.setdefault(filename, []).append(sheet_name)
+                continue
+
+            ws_out = output_sheets.get(sheet_name)
+            if ws_out is None:
+                ws_out = output_wb.create_sheet(title=sheet_name)
+                ws_out.append(header_values)
+                output_sheets[sheet_name] = ws_out
+
+            for row_values in data_rows:
+                ws_out.append(row_values)
+            total_rows += len(data_rows)
+
+    return _workbook_bytes(output_wb), missing_by_file, total_rows
+
+
+@st.cache_data(show_spinner=False)
+def build_consolidated_workbook(
+    _uploaded_files: Sequence[Tuple[str, bytes]],
+    file_digests: Sequence[Tuple[str, bytes]],
+    header_label: str,
+    preserve_styles: bool = True,
+) -> Tuple[Optional[bytes], Dict[str, List[str]], int]:
+    """Merge the workbooks into one, returning its bytes, sheets missing the header, and the merged row count."""
+    if not _uploaded_files:
         return None, {}, 0
 
     header_variants = [header_label, f"{header_label}s"]
+    if not preserve_styles:
+        return _build_values_only_workbook(_uploaded_files, file_digests, header_variants)
+
     missing_by_file: Dict[str, List[str]] = {}
+    header_cache: Dict[str, Tuple[tuple, Tuple[str, int]]] = {}
 
-    base_name, base_bytes = uploaded_files[0]
+    base_name, base_bytes = _uploaded_files[0]
     base_wb = openpyxl.load_workbook(BytesIO(base_bytes))
     sheet_header_rows: Dict[str, int] = {}
 
     for sheet_name in base_wb.sheetnames:
         ws = base_wb[sheet_name]
-        col_letter, header_row = get_column_letter_by_header(ws, header_variants)
+        col_letter, header_row = _find_header_cached(ws, header_variants, header_cache)
         if not col_letter:
             missing_by_file.setdefault(base_name, []).append(sheet_name)
             continue
@@ -79,11 +282,12 @@ def build_consolidated_workbook(
         total_rows += max(0, _last_data_row(ws, header_row) - header_row)
 
     # Process additional workbooks
-    for filename, file_bytes in uploaded_files[1:]:
+    for filename, file_bytes in _uploaded_files[1:]:
         workbook = openpyxl.load_workbook(BytesIO(file_bytes))
+        style_cache: Dict[Tuple[int, ...], StyleArray] = {}
         for sheet_name in workbook.sheetnames:
             ws_src = workbook[sheet_name]
-            col_letter, header_row = get_column_letter_by_header(ws_src, header_variants)
+            col_letter, header_row = _find_header_cached(ws_src, header_variants, header_cache)
             if not col_letter:
                 missing_by_file.setdefault(filename, []).append(sheet_name)
                 continue
@@ -93,32 +297,23 @@ def build_consolidated_workbook(
                 ws_dest = base_wb.create_sheet(title=sheet_name)
                 sheet_header_rows[sheet_name] = header_row
                 header_row_cells = ws_src[header_row]
-                _append_row_with_style(ws_dest, header_row_cells)
+                _append_row_with_style(ws_dest, header_row_cells, style_cache)
                 # Ensure rows below header start empty
                 ws_dest.delete_rows(sheet_header_rows[sheet_name] + 1, ws_dest.max_row - sheet_header_rows[sheet_name])
             else:
                 ws_dest = base_wb[sheet_name]
 
-            dest_header_row = sheet_header_rows[sheet_name]
-            last_row = _last_data_row(ws_dest, dest_header_row)
-
-            for row_idx in range(header_row + 1, ws_src.max_row + 1):
-                source_row = ws_src[row_idx]
+            for source_row in ws_src.iter_rows(min_row=header_row + 1, max_row=ws_src.max_row):
                 if all(cell.value in (None, "") for cell in source_row):
                     continue
-                _append_row_with_style(ws_dest, source_row)
+                _append_row_with_style(ws_dest, source_row, style_cache)
                 total_rows += 1
-
-            # Ensure we preserve spacing: remove unintended blank rows between header and data
-            if last_row == dest_header_row and ws_dest.max_row > dest_header_row:
-                pass  # header only previously, nothing to clean
         workbook.close()
 
-    buffer = BytesIO()
-    base_wb.save(buffer)
+    workbook_bytes = _workbook_bytes(base_wb)
     base_wb.close()
 
-    return buffer.getvalue(), missing_by_file, total_rows
+    return workbook_bytes, missing_by_file, total_rows
 
 
 def main():
@@ -148,19 +343,28 @@ def main():
         help="The generated file name will append .xlsx automatically if you omit it.",
         key="consolidate_output_name",
     )
+    preserve_styles = st.toggle(
+        "Preserve cell styles",
+        value=True,
+        help="Turn off to copy values and formulas without styles, which is much faster for large workbooks.",
+        key="consolidate_preserve_styles",
+    )
 
     uploaded_files = st.file_uploader(
         "Upload one or more workbooks (.xlsx) to consolidate", type=["xlsx"], accept_multiple_files=True
     )
 
     file_buffers: Optional[Sequence[Tuple[str, bytes]]] = None
+    file_digests: Optional[Tuple[Tuple[str, bytes], ...]] = None
     result_key = None
     if uploaded_files:
         file_buffers = _load_uploaded_files(uploaded_files)
+        file_digests = tuple((name, workbook_digest(file_bytes)) for name, file_bytes in file_buffers)
         result_key = (
-            file_buffers,
+            file_digests,
             target_header,
             output_name_input.strip(),
+            preserve_styles,
         )
 
     stored_results = st.session_state.get("consolidation_results")
@@ -176,7 +380,7 @@ def main():
 
         with st.spinner("Consolidating workbooks..."):
             workbook_bytes, missing_sheets, row_count = build_consolidated_workbook(
-                file_buffers, target_header
+                file_buffers, file_digests, target_header, preserve_styles
             )
 
         if not workbook_bytes:
@@ -187,8 +391,8 @@ def main():
             st.session_state.pop("consolidation_results", None)
             return
 
+        # The workbook itself stays in the data cache rather than being copied into every session.
         stored_results = {
-            "workbook": workbook_bytes,
             "missing_sheets": missing_sheets,
             "row_count": row_count,
             "target_header": target_header,
@@ -197,6 +401,13 @@ def main():
         st.session_state["consolidation_results"] = stored_results
     elif should_show_results:
         stored_results = st.session_state["consolidation_results"]
+        # A cache hit: the key is the digests already computed for result_key, so the uploads are
+        # not rehashed. Each rerun does copy the cached output once; that is the price of not
+        # pinning it in session state.
+        with st.spinner("Consolidating workbooks..."):
+            workbook_bytes, _, _ = build_consolidated_workbook(
+                file_buffers, file_digests, target_header, preserve_styles
+            )
     else:
         if not uploaded_files:
             st.session_state.pop("consolidation_results", None)
@@ -229,9 +440,10 @@ def main():
 
     st.download_button(
         label=f"Download {output_name}",
-        data=stored_results["workbook"],
+        data=workbook_bytes,
         file_name=output_name,
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        on_click="ignore",
         use_container_width=True,
     )
 